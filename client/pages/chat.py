@@ -1,12 +1,20 @@
+import textwrap
+
 import streamlit as st
 from openai import OpenAI
 
 from menu import menu
 from settings import load_session_state_from_db
+from resources import get_vector_store
 
-from dbt_llm_tools import VectorStore
 from dbt_llm_tools.instructions import ANSWER_QUESTION_INSTRUCTIONS
 
+ADDITIONAL_CONTEXT_PROMPT = textwrap.dedent(
+    """\
+    In addition to information you have already, here is more information about certain tables
+    that might help you answer the users question.:"""
+)
+
 st.set_page_config(page_title="Chatbot", page_icon="🤖", layout="wide")
 
 menu()
@@ -14,15 +22,7 @@ load_session_state_from_db()
 
 st.session_state.is_new_question = len(st.session_state.get("messages", [])) == 0
 
-vector_store = VectorStore(
-    vector_db_path=st.session_state.get(
-        "vector_store_path", ".local_storage/chroma.db"
-    ),
-    embedding_model_name=st.session_state.get(
-        "openai_embedding_model", "text-embedding-3-large"
-    ),
-    openai_api_key=st.session_state.get("openai_api_key", ""),
-)
+vector_store = get_vector_store()
 
 
 def get_matching_models(query):
@@ -75,13 +75,7 @@ if prompt := st.chat_input("What is up?", disabled=CHATBOT_DISABLED):
 
     if closest_models:
         st.session_state.messages.append(
-            {
-                "role": "system",
-                "content": """
-                    In addition to information you have already, here is more information about certain tables
-                    that might help you answer the users question.:
-                """,
-            }
+            {"role": "system", "content": ADDITIONAL_CONTEXT_PROMPT}
         )
 
         for model in closest_models:
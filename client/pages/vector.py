@@ -3,8 +3,9 @@ import streamlit as st
 from menu import menu
 from styles import button_override
 from settings import load_session_state_from_db
+from resources import get_vector_store
 
-from dbt_llm_tools import DbtProject, VectorStore, DbtModel
+from dbt_llm_tools import DbtProject, DbtModel
 
 st.set_page_config(page_title="Configuration", page_icon="🤖", layout="wide")
 
@@ -17,13 +18,7 @@ st.caption(
     f"Your vector store is located at {st.session_state.get('vector_store_path')}."
 )
 
-vector_store = VectorStore(
-    vector_db_path=st.session_state.get("vector_store_path", ".local_storage"),
-    embedding_model_name=st.session_state.get(
-        "openai_embedding_model", "text-embedding-3-large"
-    ),
-    openai_api_key=st.session_state.get("openai_api_key", ""),
-)
+vector_store = get_vector_store()
 
 setting_tab, view_tab = st.tabs(["Settings", "View Vector Store"])
 
@@ -0,0 +1,26 @@
+import streamlit as st
+
+from dbt_llm_tools import VectorStore
+
+
+# Streamlit reruns every page on each interaction, so share a single vector store
+# per configuration instead of reconnecting to the database on every rerun.
+@st.cache_resource
+def load_vector_store(vector_db_path, embedding_model_name, openai_api_key):
+    return VectorStore(
+        vector_db_path=vector_db_path,
+        embedding_model_name=embedding_model_name,
+        openai_api_key=openai_api_key,
+    )
+
+
+def get_vector_store():
+    return load_vector_store(
+        vector_db_path=st.session_state.get(
+            "vector_store_path", ".local_storage/chroma.db"
+        ),
+        embedding_model_name=st.session_state.get(
+            "openai_embedding_model", "text-embedding-3-large"
+        ),
+        openai_api_key=st.session_state.get("openai_api_key", ""),
+    )
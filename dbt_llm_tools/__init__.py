@@ -1,7 +1,8 @@
-from dbt_llm_tools.chatbot import Chatbot
+import importlib
+from typing import TYPE_CHECKING
+
 from dbt_llm_tools.dbt_model import DbtModel
 from dbt_llm_tools.dbt_project import DbtProject
-from dbt_llm_tools.documentation_generator import DocumentationGenerator
 from dbt_llm_tools.instructions import (
     ANSWER_QUESTION_INSTRUCTIONS,
     INTERPRET_MODEL_INSTRUCTIONS,
@@ -12,4 +13,40 @@ from dbt_llm_tools.types import (
     ParsedSearchResult,
     PromptMessage,
 )
-from dbt_llm_tools.vector_store import VectorStore
+
+if TYPE_CHECKING:
+    from dbt_llm_tools.chatbot import Chatbot
+    from dbt_llm_tools.documentation_generator import DocumentationGenerator
+    from dbt_llm_tools.vector_store import VectorStore
+
+# These classes pull in openai and chromadb, which are slow to import, so they are
+# only loaded the first time they are accessed.
+_LAZY_IMPORTS = {
+    "Chatbot": "dbt_llm_tools.chatbot",
+    "DocumentationGenerator": "dbt_llm_tools.documentation_generator",
+    "VectorStore": "dbt_llm_tools.vector_store",
+}
+
+__all__ = [
+    "ANSWER_QUESTION_INSTRUCTIONS",
+    "INTERPRET_MODEL_INSTRUCTIONS",
+    "Chatbot",
+    "DbtModel",
+    "DbtModelDict",
+    "DbtModelDirectoryEntry",
+    "DbtProject",
+    "DocumentationGenerator",
+    "ParsedSearchResult",
+    "PromptMessage",
+    "VectorStore",
+]
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+
+    return value
@@ -1,13 +1,31 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Iterator, Union
+
 from openai import OpenAI
+from openai.types.chat import ChatCompletionMessage
 
 from dbt_llm_tools.dbt_model import DbtModel
 from dbt_llm_tools.dbt_project import DbtProject
 from dbt_llm_tools.instructions import ANSWER_QUESTION_INSTRUCTIONS
-from dbt_llm_tools.types import ParsedSearchResult, PromptMessage
-from dbt_llm_tools.vector_store import VectorStore
+from dbt_llm_tools.types import (
+    DbtModelDirectoryEntry,
+    ParsedSearchResult,
+    PromptMessage,
+)
+from dbt_llm_tools.vector_store import UPSERT_BATCH_SIZE, VectorStore
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL_SECONDS = 3600
 
 
-class Chatbot:
+class Chatbot:  # pylint: disable=too-many-instance-attributes
     """
     A class representing a chatbot that allows users to ask questions about dbt models.
 
@@ -23,6 +41,8 @@ class Chatbot:
         load_models: Load the models into the vector store.
         reset_model_db: Reset the model vector store.
         ask_question: Ask the chatbot a question and get a response.
+        cache_stats: Get the hit and miss counts of the response cache.
+        close: Close the connections held by the OpenAI client.
     """
 
     def __init__(
@@ -33,6 +53,10 @@ class Chatbot:
         vector_db_path: str = ".local_storage/chroma.db",
         embedding_model: str = "text-embedding-3-large",
         chatbot_model: str = "gpt-4o",
+        hnsw_search_ef: int = None,
+        hnsw_construction_ef: int = None,
+        response_cache_ttl: int = RESPONSE_CACHE_TTL_SECONDS,
+        openai_client: OpenAI = None,
     ) -> None:
         """
         Initializes a chatbot object along with a default set of instructions.
@@ -55,24 +79,51 @@ class Chatbot:
                 The name of the OpenAI chatbot model to be used.
                 Defaults to "gpt-4o".
 
+            hnsw_search_ef (int, optional):
+                Size of the candidate list used by the vector store's HNSW index at query time.
+                Defaults to the value stored with the collection.
+
+            hnsw_construction_ef (int, optional):
+                Size of the candidate list used while building the vector store's HNSW index.
+                Only applies to new collections. Defaults to the value stored with the collection.
+
+            response_cache_ttl (int, optional):
+                The number of seconds a response is reused for when the same question is asked
+                with the same context. None or 0 disables the response cache. Defaults to 3600.
+
+            openai_client (OpenAI, optional):
+                An existing OpenAI client to send requests through.
+                Defaults to a new client created with the API key.
+
         Returns:
             None
         """
         self.__chatbot_model: str = chatbot_model
-        self.__openai_api_key: str = openai_api_key
 
         self.project: DbtProject = DbtProject(
             dbt_project_root=dbt_project_root, database_path=database_path
         )
 
+        # The vector store sends its embedding requests through the same client, so
+        # embeddings and chat completions share one pool of keep-alive connections.
+        self.client = openai_client or OpenAI(api_key=openai_api_key)
+        self.__owns_client: bool = openai_client is None
+
         self.store: VectorStore = VectorStore(
-            openai_api_key, embedding_model, vector_db_path
+            openai_api_key,
+            embedding_model,
+            vector_db_path,
+            hnsw_search_ef=hnsw_search_ef,
+            hnsw_construction_ef=hnsw_construction_ef,
+            openai_client=self.client,
         )
 
-        self.client = OpenAI(api_key=self.__openai_api_key)
-
         self.__instructions: list[str] = [ANSWER_QUESTION_INSTRUCTIONS]
 
+        self.__response_cache_ttl: int = response_cache_ttl or 0
+        self.__response_cache: OrderedDict[str, tuple] = OrderedDict()
+        self.__cache_counts: dict[str, int] = {"hits": 0, "misses": 0}
+
     def __prepare_prompt(
         self, closest_models: list[ParsedSearchResult], query: str
     ) -> list[PromptMessage]:
@@ -86,18 +137,150 @@ class Chatbot:
         Returns:
             list[PromptMessage]: A list of prompt messages to be used by the chatbot.
         """
-        prompt: list[PromptMessage] = []
-
-        for instruction in self.__instructions:
-            prompt.append({"role": "system", "content": instruction})
-
-        for model in closest_models:
-            prompt.append({"role": "system", "content": model["document"]})
+        prompt: list[PromptMessage] = [
+            {"role": "system", "content": instruction}
+            for instruction in self.__instructions
+        ]
+
+        # The model documents are sent as a single context message rather than one message each.
+        if closest_models:
+            prompt.append(
+                {
+                    "role": "system",
+                    "content": "\n\n---\n\n".join(
+                        model["document"] for model in closest_models
+                    ),
+                }
+            )
 
         prompt.append({"role": "user", "content": query})
 
         return prompt
 
+    def __get_response_cache_key(self, prompt: list[PromptMessage]) -> str:
+        """
+        Get the response cache key for a prompt.
+        The prompt already holds the instructions, the closest model documents and the query,
+        so a cached response is only reused when the language model would see the same input.
+
+        Args:
+            prompt (list[PromptMessage]): The prompt to be sent to the chatbot.
+
+        Returns:
+            str: The SHA-256 hash of the chatbot model and the prompt.
+        """
+        return hashlib.sha256(
+            json.dumps(
+                {"model": self.__chatbot_model, "messages": prompt}, sort_keys=True
+            ).encode()
+        ).hexdigest()
+
+    def __get_cached_response(
+        self, cache_key: str
+    ) -> Union[ChatCompletionMessage, None]:
+        """
+        Get a chatbot response from the response cache, removing it if it has expired.
+
+        Args:
+            cache_key (str): The response cache key of the prompt.
+
+        Returns:
+            ChatCompletionMessage: The cached response, or None if there is no response that has not expired.
+        """
+        cached_response = self.__response_cache.get(cache_key)
+
+        if cached_response is None:
+            return None
+
+        if time.monotonic() - cached_response[0] >= self.__response_cache_ttl:
+            del self.__response_cache[cache_key]
+            return None
+
+        self.__response_cache.move_to_end(cache_key)
+
+        return cached_response[1]
+
+    def __cache_response(self, cache_key: str, message: ChatCompletionMessage) -> None:
+        """
+        Store a chatbot response in the response cache, evicting the least recently used entry if it is full.
+        Nothing is stored when the response cache is disabled.
+
+        Args:
+            cache_key (str): The response cache key of the prompt.
+            message (ChatCompletionMessage): The chatbot's response to the prompt.
+
+        Returns:
+            None
+        """
+        if not self.__response_cache_ttl:
+            return None
+
+        self.__response_cache[cache_key] = (time.monotonic(), message)
+        self.__response_cache.move_to_end(cache_key)
+
+        if len(self.__response_cache) > RESPONSE_CACHE_SIZE:
+            self.__response_cache.popitem(last=False)
+
+        return None
+
+    def __stream_response(
+        self, prompt: list[PromptMessage], cache_key: str
+    ) -> Iterator[str]:
+        """
+        Stream the chatbot's response to a prompt as it is generated.
+        The full response is cached once the stream has been consumed to the end.
+
+        Args:
+            prompt (list[PromptMessage]): The prompt to be sent to the chatbot.
+            cache_key (str): The response cache key of the prompt.
+
+        Returns:
+            Iterator[str]: The pieces of the chatbot's response in the order they are received.
+        """
+        completion = self.client.chat.completions.create(
+            model=self.__chatbot_model,
+            messages=prompt,
+            stream=True,
+        )
+        parts = []
+
+        for chunk in completion:  # pylint: disable=not-an-iterable
+            if len(chunk.choices) == 0:
+                continue
+
+            delta = chunk.choices[0].delta.content
+
+            if delta:
+                parts.append(delta)
+                yield delta
+
+        self.__cache_response(
+            cache_key, ChatCompletionMessage(role="assistant", content="".join(parts))
+        )
+
+    def cache_stats(self) -> dict[str, int]:
+        """
+        Get the hit and miss counts of the response cache.
+
+        Returns:
+            dict[str, int]: The number of cache hits, cache misses and cached responses.
+        """
+        return {
+            **self.__cache_counts,
+            "size": len(self.__response_cache),
+        }
+
+    def close(self) -> None:
+        """
+        Close the connections held by the OpenAI client shared with the vector store.
+        A client passed in through openai_client is left open, because it may have other users.
+
+        Returns:
+            None
+        """
+        if self.__owns_client:
+            self.client.close()
+
     def set_embedding_model(self, model: str) -> None:
         """
         Set the embedding model for the vector store.
@@ -143,11 +326,27 @@ class Chatbot:
         """
         self.__instructions = instructions
 
+    def __get_model_folder(self, model: DbtModelDirectoryEntry) -> Union[str, None]:
+        """
+        Get the folder of a model relative to the dbt project root.
+
+        Args:
+            model (DbtModelDirectoryEntry): The directory entry of the model.
+
+        Returns:
+            str: The folder containing the model's SQL file, or None if the model has no SQL file.
+        """
+        if "relative_path" not in model:
+            return None
+
+        return os.path.dirname(model["relative_path"]).strip("/")
+
     def load_models(
         self,
         models: list[str] = None,
         included_folders: list[str] = None,
         excluded_folders: list[str] = None,
+        batch_size: int = UPSERT_BATCH_SIZE,
     ) -> None:
         """
         Upsert the set of models that will be available to your chatbot into a vector store.
@@ -165,12 +364,21 @@ class Chatbot:
             exclude_folders (list[str], optional): A list of paths to all folders that should be excluded
             in model search. Paths are relative to dbt project root.
 
+            batch_size (int, optional): The maximum number of models sent to the embedding model
+            in a single request. Defaults to 96.
+
         Returns:
             None
         """
         models = self.project.get_models(models, included_folders, excluded_folders)
         self.store.upsert_models(
-            list(map(lambda x: DbtModel(x.get("documentation")), models))
+            [
+                DbtModel(
+                    model.get("documentation"), folder=self.__get_model_folder(model)
+                )
+                for model in models
+            ],
+            batch_size=batch_size,
         )
 
     def reset_model_db(self) -> None:
@@ -183,39 +391,88 @@ class Chatbot:
         """
         self.store.reset_collection()
 
-    def ask_question(self, query: str, get_model_names_only: bool = False) -> str:
+    def ask_question(
+        self,
+        query: str,
+        get_model_names_only: bool = False,
+        folder_filter: list[str] = None,
+        stream: bool = False,
+        query_embedding: list[float] = None,
+    ) -> Union[ChatCompletionMessage, Iterator[str], str]:
         """
         Ask the chatbot a question about your dbt models and get a response.
         The chatbot looks the dbt models most similar to the user query and uses them to answer the question.
 
         Args:
             query (str): The question you want to ask the chatbot.
+            get_model_names_only (bool, optional): Whether to only return the names of the closest models
+            instead of asking the language model. Defaults to False.
+            folder_filter (list[str], optional): Only consider models stored in these folders or their subfolders,
+            given relative to the dbt project root, e.g. ["models/marts"]. Defaults to all models.
+            stream (bool, optional): Whether to return the response as an iterator of text pieces
+            that are yielded as soon as the language model generates them. Defaults to False.
+            query_embedding (list[float], optional): An existing embedding of the question, created with
+            the embedding model of the vector store. When provided, the question is not embedded again.
 
         Returns:
-            str: The chatbot's response to your question.
+            ChatCompletionMessage: The chatbot's response to your question.
+            Iterator[str]: The pieces of the chatbot's response, if stream is True.
+            str: A comma separated list of the names of the closest models, if get_model_names_only is True.
         """
-        print("Asking question: ", query)
+        logger.info("Asking question: %s", query)
 
-        print("\nLooking for closest models to the query...")
+        logger.info("Looking for closest models to the query...")
 
-        closest_models = self.store.query_collection(query)
-        model_names = ", ".join(map(lambda x: x["id"], closest_models))
+        closest_models = self.store.query_collection(
+            query,
+            where=(
+                self.store.get_folder_filter(folder_filter) if folder_filter else None
+            ),
+            query_embedding=query_embedding,
+        )
+        model_names = ", ".join(model["id"] for model in closest_models)
 
         if get_model_names_only:
             return model_names
 
-        print("Closest models found:", model_names)
+        logger.info("Closest models found: %s", model_names)
 
-        print("\nPreparing prompt...")
+        logger.info("Preparing prompt...")
         prompt = self.__prepare_prompt(closest_models, query)
+        logger.debug("Prompt: %s", prompt)
+
+        cache_key = self.__get_response_cache_key(prompt)
+        cached_response = (
+            self.__get_cached_response(cache_key) if self.__response_cache_ttl else None
+        )
+
+        if cached_response is not None:
+            self.__cache_counts["hits"] += 1
+
+            logger.info("Response found in cache.")
+            logger.debug("Response: %s", cached_response.content)
 
-        print("\nCalculating response...")
+            if stream:
+                return iter([cached_response.content])
+
+            return cached_response
+
+        if self.__response_cache_ttl:
+            self.__cache_counts["misses"] += 1
+
+        if stream:
+            logger.info("Streaming response...")
+            return self.__stream_response(prompt, cache_key)
+
+        logger.info("Calculating response...")
         completion = self.client.chat.completions.create(
             model=self.__chatbot_model,
             messages=prompt,
         )
 
-        print("\nResponse received: \n")
-        print(completion.choices[0].message.content)
+        logger.info("Response received.")
+        logger.debug("Response: %s", completion.choices[0].message.content)
+
+        self.__cache_response(cache_key, completion.choices[0].message)
 
         return completion.choices[0].message
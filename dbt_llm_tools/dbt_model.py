@@ -12,16 +12,19 @@ class DbtModel:
         description (str, optional): The description of the model.
         columns (list[DbtModelColumn], optional):
             A list of columns contained in the model. May or may not be exhaustive.
+        folder (str, optional): The folder of the model relative to the dbt project root.
     """
 
-    def __init__(self, documentation: DbtModelDict) -> None:
+    def __init__(self, documentation: DbtModelDict, folder: str = None) -> None:
         """
         Initializes a dbt model object.
 
         Args:
             model_dict (dict): A dictionary containing the model name, description and columns.
+            folder (str, optional): The folder of the model relative to the dbt project root.
         """
         self.name = documentation.get("name")
+        self.folder = folder
 
         if self.name is None:
             raise Exception("Cannot create a model without a valid name.")
@@ -52,22 +55,22 @@ class DbtModel:
             str: A text description of the model, including the list of columns with their descriptions.
         """
         if self.description == "":
-            model_text = f"The table { self.name } does not have a description."
+            parts = [f"The table { self.name } does not have a description."]
         else:
-            model_text = (
+            parts = [
                 f"The table { self.name } is described as follows: { self.description }"
-            )
-
-        if len(list(self.columns)) > 0:
-            model_text += "\nThis table contains the following columns:\n"
-
-            for col in self.columns:
-                model_text += "\n"
-                model_text += (
-                    f"- { col['name'] }: { col.get('description', 'No description')}"
+            ]
+
+        if len(self.columns) > 0:
+            parts.append("\nThis table contains the following columns:\n")
+            parts.append(
+                "".join(
+                    f"\n- { col['name'] }: { col.get('description', 'No description')}"
+                    for col in self.columns
                 )
+            )
 
-        return model_text
+        return "".join(parts)
 
     def as_dict(self) -> DbtModelDict:
         """
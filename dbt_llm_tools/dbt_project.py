@@ -1,5 +1,4 @@
 import glob
-import json
 import os
 import re
 from typing import Union
@@ -7,14 +6,18 @@ from typing import Union
 import yaml
 
 from tinydb import TinyDB, Query
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage, MemoryStorage
 
 from dbt_llm_tools.types import DbtModelDirectoryEntry, DbtProjectDirectory
 
-SOURCE_SEARCH_EXPRESSION = r"source\(['\"]*(.*?)['\"]*,\s*['\"]*(.*?)['\"]*\)"
-REF_SEARCH_EXPRESSION = r"ref\(['\"]*(.*?)['\"]*\)"
+SOURCE_SEARCH_EXPRESSION = re.compile(
+    r"source\(['\"]*(.*?)['\"]*,\s*['\"]*(.*?)['\"]*\)"
+)
+REF_SEARCH_EXPRESSION = re.compile(r"ref\(['\"]*(.*?)['\"]*\)")
 
 
-class DbtProject:
+class DbtProject:  # pylint: disable=too-many-instance-attributes
     """
     A class representing a DBT project.
     """
@@ -53,6 +56,16 @@ class DbtProject:
         self.__sql_files = self.__get_all_files("sql")
         self.__yaml_files = self.__get_all_files("yml")
 
+        self.__sql_files_by_name = {}
+        for sql_file in self.__sql_files:
+            self.__sql_files_by_name.setdefault(
+                os.path.basename(sql_file).replace(".sql", ""), sql_file
+            )
+
+        self.__file_references = {}
+        self.__model_dependencies = {}
+        self.__directory_cache = None
+
     def __get_all_files(self, file_extension: str):
         """
         Get all files of a certain type in the dbt project.
@@ -77,45 +90,97 @@ class DbtProject:
 
         return files
 
-    def __find_upstream_references(
-        self, file_path: str, recursive: bool = False, dependencies: list[str] = None
-    ):
+    def __find_upstream_references(self, file_path: str) -> list[str]:
         """
         Find upstream references in a SQL file.
 
         Args:
             file_path (str): The path to the SQL file.
-            recursive (bool, optional): Whether to recursively search for upstream references.
-            dependencies (list, optional): A list of dependencies to add to.
 
         Returns:
-            list: A list of upstream references.
+            list: A list of upstream references in the order they first appear in the file.
+        """
+        # Shared upstream models are referenced by many files, so only read
+        # and search each file once per parse.
+        unique_results = self.__file_references.get(file_path)
+
+        if unique_results is None:
+            with open(file_path, encoding="utf-8") as f:
+                file_contents = f.read()
+
+            search_results = REF_SEARCH_EXPRESSION.findall(file_contents)
+            unique_results = list(dict.fromkeys(search_results))
+            self.__file_references[file_path] = unique_results
+
+        return unique_results
+
+    def __get_model_refs(self, model_name: str) -> list[str]:
+        """
+        Get the models referenced directly by a model, ignoring references to itself.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            list: A list of upstream references, or an empty list if the model has no SQL file.
+        """
+        file_path = self.__sql_files_by_name.get(model_name)
+
+        if file_path is None:
+            return []
+
+        return [
+            ref
+            for ref in self.__find_upstream_references(file_path)
+            if ref != model_name
+        ]
+
+    def __find_upstream_dependencies(self, model_name: str) -> list[str]:
         """
-        if dependencies is None:
-            dependencies = []
+        Find all the models a model depends on, directly or through other models.
+
+        Args:
+            model_name (str): The name of the model.
 
-        with open(file_path, encoding="utf-8") as f:
-            file_contents = f.read()
+        Returns:
+            list: The upstream dependencies in topological order, so that every model
+            comes after the models it references.
+        """
+        # Walk the ref graph depth first without recursion and remember the dependencies
+        # of every finished model, so shared upstream models are only walked once per parse.
+        in_progress = {model_name}
+        stack = [(model_name, iter(self.__get_model_refs(model_name)))]
 
-        search_results = re.findall(REF_SEARCH_EXPRESSION, file_contents)
-        unique_results = list(set(search_results))
+        while stack and model_name not in self.__model_dependencies:
+            name, refs = stack[-1]
 
-        if recursive:
-            for result in unique_results:
-                if result in dependencies or result in file_path:
+            for ref in refs:
+                if ref in self.__model_dependencies:
                     continue
 
-                sub_file_path = next(
-                    (x for x in self.__sql_files if x.endswith(f"/{result}.sql")), None
-                )
-                if sub_file_path is not None:
-                    dependencies = self.__find_upstream_references(
-                        file_path=sub_file_path,
-                        recursive=True,
-                        dependencies=dependencies,
+                if ref in in_progress:
+                    raise Exception(
+                        f"Circular reference found between models {name} and {ref}"
                     )
 
-        return dependencies + unique_results
+                in_progress.add(ref)
+                stack.append((ref, iter(self.__get_model_refs(ref))))
+                break
+            else:
+                stack.pop()
+                in_progress.discard(name)
+
+                dependencies = {}
+
+                for ref in self.__get_model_refs(name):
+                    dependencies.update(
+                        dict.fromkeys(self.__model_dependencies.get(ref, []))
+                    )
+                    dependencies[ref] = None
+
+                self.__model_dependencies[name] = list(dependencies)
+
+        return self.__model_dependencies[model_name]
 
     def __parse_sql_file(self, sql_file: str):
         """
@@ -130,7 +195,7 @@ class DbtProject:
         with open(sql_file, encoding="utf-8") as f:
             sql_contents = f.read()
 
-        source_search = re.findall(SOURCE_SEARCH_EXPRESSION, sql_contents)
+        source_search = SOURCE_SEARCH_EXPRESSION.findall(sql_contents)
 
         sources = [{"name": match[0], "table": match[1]} for match in source_search]
 
@@ -139,8 +204,10 @@ class DbtProject:
             "absolute_path": sql_file,
             "relative_path": sql_file.replace(self.__project_root, ""),
             "name": os.path.basename(sql_file).replace(".sql", ""),
-            "refs": self.__find_upstream_references(sql_file, False),
-            "deps": self.__find_upstream_references(sql_file, True),
+            "refs": self.__find_upstream_references(sql_file),
+            "deps": self.__find_upstream_dependencies(
+                os.path.basename(sql_file).replace(".sql", "")
+            ),
             "sources": sources,
             "sql_contents": sql_contents,
         }
@@ -177,16 +244,6 @@ class DbtProject:
 
         return models, sources
 
-    def __get_directory(self):
-        """
-        Get the parsed directory from the directory file.
-
-        Returns:
-            dict: The parsed directory.
-        """
-        with open(self.__database_path, encoding="utf-8") as f:
-            return json.load(f)
-
     def __save_directory(self, directory):
         """
         Save the parsed directory to a file.
@@ -194,17 +251,78 @@ class DbtProject:
         Args:
             directory (dict): The directory to save.
         """
-        db = TinyDB(self.__database_path, sort_keys=True, indent=4)
-        Model = Query()  # pylint: disable=invalid-name
-        Source = Query()  # pylint: disable=invalid-name
+        updates = {}
 
         for name, model in directory["models"].items():
             if "name" in model:
-                db.upsert(model, Model.name == name)
+                updates.setdefault(name, []).append(model)
 
-        for name, source in directory["sources"].items():
+        for source in directory["sources"].values():
             if "name" in source:
-                db.upsert(source, Source.name == source["name"])
+                updates.setdefault(source["name"], []).append(source)
+
+        def apply_updates(document):
+            for fields in updates[document["name"]]:
+                document.update(fields)
+
+        # Upserting one document at a time rescans and rewrites the whole table on every call,
+        # so update all existing documents in one pass, insert the new ones in another
+        # and flush the result to disk once when the database is closed.
+        with TinyDB(
+            self.__database_path,
+            storage=CachingMiddleware(JSONStorage),
+            sort_keys=True,
+            indent=4,
+        ) as db:
+            existing = {
+                document.doc_id: document["name"]
+                for document in db
+                if document.get("name") in updates
+            }
+
+            if existing:
+                db.update(apply_updates, doc_ids=list(existing))
+
+            stored_names = set(existing.values())
+            new_documents = []
+
+            for name, documents in updates.items():
+                if name not in stored_names:
+                    new_document = {}
+
+                    for fields in documents:
+                        new_document.update(fields)
+
+                    new_documents.append(new_document)
+
+            if new_documents:
+                db.insert_multiple(new_documents)
+
+        self.__directory_cache = None
+
+    def __get_directory_db(self) -> TinyDB:
+        """
+        Get an in-memory copy of the directory to run read queries against.
+        The directory file is only read and parsed again when it has changed on disk.
+
+        Returns:
+            TinyDB: A database holding the documents of the directory file.
+        """
+        db = TinyDB(storage=MemoryStorage)
+
+        if not os.path.isfile(self.__database_path):
+            return db
+
+        stat = os.stat(self.__database_path)
+        file_version = (stat.st_mtime_ns, stat.st_size)
+
+        if self.__directory_cache is None or self.__directory_cache[0] != file_version:
+            with TinyDB(self.__database_path) as file_db:
+                self.__directory_cache = (file_version, file_db.storage.read() or {})
+
+        db.storage.write(self.__directory_cache[1])
+
+        return db
 
     def parse(self) -> DbtProjectDirectory:
         """
@@ -214,6 +332,8 @@ class DbtProject:
             dict: The parsed directory.
         """
         source_sql_models = {}
+        self.__file_references = {}
+        self.__model_dependencies = {}
 
         for sql_file in self.__sql_files:
             parsed_model = self.__parse_sql_file(sql_file)
@@ -257,8 +377,7 @@ class DbtProject:
         if model_name is None:
             raise Exception("No model name provided")
 
-        # directory = self.__get_directory()
-        db = TinyDB(self.__database_path)
+        db = self.__get_directory_db()
         Model = Query()  # pylint: disable=invalid-name
 
         return db.get(Model.name == model_name)
@@ -282,16 +401,22 @@ class DbtProject:
         """
         searched_models = []
 
-        db = TinyDB(self.__database_path)
+        db = self.__get_directory_db()
         Model = Query()  # pylint: disable=invalid-name
         File = Query()  # pylint: disable=invalid-name
 
         if models is None and included_folders is None:
             searched_models = db.search(File.type == "model")
 
-        for model in models or []:
-            if model := db.get(Model.name == model):
-                searched_models.append(model)
+        if models:
+            named_models = {}
+
+            for model in db.search(Model.name.one_of(models)):
+                named_models.setdefault(model["name"], model)
+
+            searched_models.extend(
+                named_models[model] for model in models if model in named_models
+            )
 
         for included_folder in included_folders or []:
             for model in db.search(File.type == "model"):
@@ -300,12 +425,16 @@ class DbtProject:
                 ) or included_folder in model.get("yaml_path", ""):
                     searched_models.append(model)
 
-        for excluded_folder in excluded_folders or []:
-            for model in searched_models.copy():
-                if excluded_folder in model.get(
-                    "absolute_path", ""
-                ) or excluded_folder in model.get("yaml_path", ""):
-                    searched_models.remove(model)
+        if excluded_folders:
+            searched_models = [
+                model
+                for model in searched_models
+                if not any(
+                    excluded_folder in model.get("absolute_path", "")
+                    or excluded_folder in model.get("yaml_path", "")
+                    for excluded_folder in excluded_folders
+                )
+            ]
 
         return searched_models
 
@@ -316,9 +445,9 @@ class DbtProject:
         Args:
             model (dict): The model to update.
         """
-        directory = self.__get_directory()
+        Model = Query()  # pylint: disable=invalid-name
 
-        if model["name"] in directory["models"]:
-            directory["models"][model["name"]] = model
+        with TinyDB(self.__database_path, sort_keys=True, indent=4) as db:
+            db.update(model, Model.name == model["name"])
 
-        self.__save_directory(directory)
+        self.__directory_cache = None
@@ -1,13 +1,43 @@
+import hashlib
 import json
+import logging
 import os
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 from openai import OpenAI
 
+# orjson is installed along with chromadb and is faster than the standard library,
+# which is used as a fallback if it is missing.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from dbt_llm_tools.dbt_project import DbtProject
 from dbt_llm_tools.instructions import INTERPRET_MODEL_INSTRUCTIONS
 from dbt_llm_tools.types import DbtModelDict, DbtModelDirectoryEntry, PromptMessage
 
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_INTERPRETATIONS = 8
+
+UPSTREAM_INTERPRETATIONS_PROMPT = textwrap.dedent(
+    """\
+    The interpretation for each of the upstream models is as follows:
+
+    {ref_interpretations}"""
+)
+
+MODEL_CODE_PROMPT = textwrap.dedent(
+    """\
+    The model you are interpreting is called {model_name}. It references the following models: {refs}.
+    Following is the Jinja SQL code for the model:
+
+    {sql_contents}"""
+)
+
 
 class MyDumper(yaml.Dumper):  # pylint: disable=too-many-ancestors
     """
@@ -29,6 +59,7 @@ class DocumentationGenerator:
         openai_api_key: str,
         language_model: str = "gpt-4o",
         database_path: str = "./directory.json",
+        openai_client: OpenAI = None,
     ) -> None:
         """
         Initializes a Documentation Generator object.
@@ -40,6 +71,8 @@ class DocumentationGenerator:
             Defaults to "gpt-4o".
             database_path (str, optional): Path to the directory file that stores the parsed dbt project.
             Defaults to "./directory.json".
+            openai_client (OpenAI, optional): An existing OpenAI client to send requests through.
+            Defaults to a new client created with the API key.
 
         Attributes:
             dbt_project (DbtProject): A DbtProject object representing the dbt project.
@@ -53,7 +86,7 @@ class DocumentationGenerator:
         )
 
         self.__language_model = language_model
-        self.__client = OpenAI(api_key=openai_api_key)
+        self.__client = openai_client or OpenAI(api_key=openai_api_key)
 
     def __get_system_prompt(self, message: str) -> PromptMessage:
         """
@@ -70,6 +103,23 @@ class DocumentationGenerator:
             "content": message,
         }
 
+    def __dump_interpretation(self, interpretation: DbtModelDict) -> str:
+        """
+        Serialize a model interpretation to compact JSON with sorted keys.
+
+        Args:
+            interpretation (dict): The interpretation to serialize.
+
+        Returns:
+            str: The JSON text of the interpretation.
+        """
+        if orjson is not None:
+            return orjson.dumps(interpretation, option=orjson.OPT_SORT_KEYS).decode()
+
+        return json.dumps(
+            interpretation, separators=(",", ":"), sort_keys=True, ensure_ascii=False
+        )
+
     def __save_interpretation_to_yaml(
         self, model: DbtModelDict, overwrite_existing: bool = False
     ) -> None:
@@ -121,56 +171,61 @@ class DocumentationGenerator:
                 sort_keys=False,
             )
 
-    def interpret_model(self, model: DbtModelDirectoryEntry) -> DbtModelDict:
+    def __request_interpretation(
+        self, model: DbtModelDirectoryEntry, ref_models: list[DbtModelDirectoryEntry]
+    ) -> DbtModelDict:
         """
-        Interpret a dbt model using the large language model.
+        Ask the large language model to interpret a dbt model.
+        This does not read the directory, so it can run in a worker thread while the directory is updated.
 
         Args:
             model (dict): The dbt model to interpret.
+            ref_models (list): The directory entries of the models referenced by the model.
 
         Returns:
             dict: The interpretation of the model.
         """
-        print(f"Interpreting model: {model['name']}")
-
-        prompt = []
-        refs = model.get("refs", [])
+        if "sql_contents" not in model:
+            raise Exception(f"No SQL code found for model {model['name']}")
 
-        prompt.append(self.__get_system_prompt(INTERPRET_MODEL_INSTRUCTIONS))
+        logger.info("Interpreting model: %s", model["name"])
 
-        prompt.append(
-            self.__get_system_prompt(
-                f"""
-                The model you are interpreting is called {model["name"]}  following is the Jinja SQL code for the model:
+        refs = model.get("refs", [])
 
-                {model.get("sql_contents")}
-                """
+        # Shared content goes first and the model's own SQL last, so that the prompts of models
+        # with the same upstream models start with the same bytes and can reuse the provider's
+        # prompt cache.
+        prompt = [self.__get_system_prompt(INTERPRET_MODEL_INSTRUCTIONS)]
+
+        if ref_models:
+            # All upstream interpretations go into one compact message, which keeps the prompt
+            # smaller than pretty-printing each interpretation into a message of its own.
+            ref_interpretations = "\n---\n".join(
+                f"## {ref_model['name']}\n"
+                + self.__dump_interpretation(ref_model.get("interpretation"))
+                for ref_model in ref_models
             )
-        )
 
-        if len(refs) > 0:
             prompt.append(
                 self.__get_system_prompt(
-                    f"""
-
-                    The model {model["name"]} references the following models: {", ".join(refs)}.
-                    The interpretation for each of these models is as follows:
-                    """
+                    UPSTREAM_INTERPRETATIONS_PROMPT.format_map(
+                        {"ref_interpretations": ref_interpretations}
+                    )
                 )
             )
 
-            for ref in refs:
-                ref_model = self.dbt_project.get_single_model(ref)
-
-                prompt.append(
-                    self.__get_system_prompt(
-                        f"""
-
-                        The model {ref} is interpreted as follows:
-                        {json.dumps(ref_model.get("interpretation"), indent=4)}
-                        """
-                    )
-                )
+        prompt.append(
+            {
+                "role": "user",
+                "content": MODEL_CODE_PROMPT.format_map(
+                    {
+                        "model_name": model["name"],
+                        "refs": ", ".join(refs) or "none",
+                        "sql_contents": model["sql_contents"],
+                    }
+                ),
+            }
+        )
 
         completion = self.__client.chat.completions.create(
             model=self.__language_model,
@@ -183,10 +238,197 @@ class DocumentationGenerator:
             .replace("```", "")
         )
 
+        if orjson is not None:
+            return orjson.loads(response)
+
         return json.loads(response)
 
+    def __get_ref_models(
+        self, model: DbtModelDirectoryEntry
+    ) -> list[DbtModelDirectoryEntry]:
+        """
+        Get the directory entries of the models referenced by a model, ordered by name.
+
+        Args:
+            model (dict): The dbt model whose references to look up.
+
+        Returns:
+            list: The directory entries of the referenced models.
+        """
+        refs = model.get("refs", [])
+
+        if not refs:
+            return []
+
+        return self.dbt_project.get_models(models=sorted(refs))
+
+    def __get_interpretation_hash(
+        self, model: DbtModelDirectoryEntry, ref_models: list[DbtModelDirectoryEntry]
+    ) -> str:
+        """
+        Get a hash of everything an interpretation of a model is based on,
+        which is its SQL code and the interpretations of the models it references.
+
+        Args:
+            model (dict): The dbt model to interpret.
+            ref_models (list): The directory entries of the models referenced by the model.
+
+        Returns:
+            str: The SHA-256 hash of the model's SQL code and the interpretations of its refs.
+        """
+        return hashlib.sha256(
+            json.dumps(
+                {
+                    "sql_contents": model.get("sql_contents"),
+                    "ref_interpretations": {
+                        ref_model["name"]: ref_model.get("interpretation")
+                        for ref_model in ref_models
+                    },
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+    def __has_current_interpretation(
+        self, model: DbtModelDirectoryEntry, interpretation_hash: str
+    ) -> bool:
+        """
+        Check whether a model has an interpretation that was made from its current SQL code
+        and the current interpretations of its refs.
+
+        Args:
+            model (dict): The dbt model to check.
+            interpretation_hash (str): The interpretation hash of the model's current inputs.
+
+        Returns:
+            bool: Whether the stored interpretation can be reused.
+        """
+        return (
+            model.get("interpretation") is not None
+            and model.get("interpretation_hash") == interpretation_hash
+        )
+
+    def __record_missing_interpretation_hash(
+        self, model: DbtModelDirectoryEntry, interpretation_hash: str
+    ) -> bool:
+        """
+        Record the interpretation hash of a model whose interpretation was stored before hashes were.
+        Such interpretations are assumed to match the model's current inputs, so they are reused
+        instead of being requested again.
+
+        Args:
+            model (dict): The dbt model to check.
+            interpretation_hash (str): The interpretation hash of the model's current inputs.
+
+        Returns:
+            bool: Whether the hash was recorded on the model.
+        """
+        if model.get("interpretation") is None or "interpretation_hash" in model:
+            return False
+
+        model["interpretation_hash"] = interpretation_hash
+
+        return True
+
+    def interpret_model(
+        self, model: DbtModelDirectoryEntry, force_reinterpret: bool = False
+    ) -> DbtModelDict:
+        """
+        Interpret a dbt model using the large language model.
+
+        Args:
+            model (dict): The dbt model to interpret.
+            force_reinterpret (bool, optional): Whether to ask the language model again even if the model
+            already has an interpretation of its current SQL code. Defaults to False.
+
+        Returns:
+            dict: The interpretation of the model.
+        """
+        ref_models = self.__get_ref_models(model)
+        interpretation_hash = self.__get_interpretation_hash(model, ref_models)
+        self.__record_missing_interpretation_hash(model, interpretation_hash)
+
+        if not force_reinterpret and self.__has_current_interpretation(
+            model, interpretation_hash
+        ):
+            logger.info("Using existing interpretation for model: %s", model["name"])
+            return model["interpretation"]
+
+        return self.__request_interpretation(model, ref_models)
+
+    def __interpret_upstream_models(self, model: DbtModelDirectoryEntry) -> None:
+        """
+        Interpret every upstream model of a dbt model whose interpretation is missing or out of date,
+        and save the new interpretations to the directory.
+
+        Args:
+            model (dict): The dbt model whose upstream models to interpret.
+
+        Returns:
+            None
+        """
+        deps = list(dict.fromkeys(model.get("deps", [])))
+        pending = {
+            dep_model["name"]: dep_model
+            for dep_model in self.dbt_project.get_models(models=deps)
+        }
+
+        # Upstream models only depend on the interpretations of their own refs, so every
+        # model whose refs have all been interpreted can be sent to the language model at once.
+        # TinyDB is not thread safe, so the directory is only read and written on this thread
+        # and the workers are given the interpretations of the refs they need.
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_INTERPRETATIONS) as executor:
+            while pending:
+                ready = [
+                    dep_model
+                    for dep_model in pending.values()
+                    if not any(ref in pending for ref in dep_model.get("refs", []))
+                ]
+
+                if len(ready) == 0:
+                    raise Exception(
+                        f"Circular references found between models: {', '.join(pending)}"
+                    )
+
+                stale_models = []
+                stale_ref_models = []
+
+                for dep_model in ready:
+                    del pending[dep_model["name"]]
+
+                    ref_models = self.__get_ref_models(dep_model)
+                    interpretation_hash = self.__get_interpretation_hash(
+                        dep_model, ref_models
+                    )
+
+                    if self.__record_missing_interpretation_hash(
+                        dep_model, interpretation_hash
+                    ):
+                        self.dbt_project.update_model_directory(dep_model)
+
+                    if self.__has_current_interpretation(
+                        dep_model, interpretation_hash
+                    ):
+                        continue
+
+                    dep_model["interpretation_hash"] = interpretation_hash
+                    stale_models.append(dep_model)
+                    stale_ref_models.append(ref_models)
+
+                for dep_model, dep_interpretation in zip(
+                    stale_models,
+                    executor.map(
+                        self.__request_interpretation, stale_models, stale_ref_models
+                    ),
+                ):
+                    dep_model["interpretation"] = dep_interpretation
+                    self.dbt_project.update_model_directory(dep_model)
+
     def generate_documentation(
-        self, model_name: str, write_documentation_to_yaml: bool = False
+        self,
+        model_name: str,
+        write_documentation_to_yaml: bool = False,
+        force_reinterpret: bool = False,
     ) -> DbtModelDict:
         """
         Generate documentation for a dbt model.
@@ -195,19 +437,29 @@ class DocumentationGenerator:
             model_name (str): The name of the model to generate documentation for.
             write_documentation_to_yaml (bool, optional): Whether to save the documentation to a yaml file.
             Defaults to False.
+            force_reinterpret (bool, optional): Whether to interpret the model again even if it already has
+            an interpretation of its current SQL code. Upstream models are only interpreted again when their
+            SQL code or the interpretations of their refs have changed. Defaults to False.
         """
         model = self.dbt_project.get_single_model(model_name)
 
-        for dep in model.get("deps", []):
-            dep_model = self.dbt_project.get_single_model(dep)
+        self.__interpret_upstream_models(model)
 
-            if dep_model.get("interpretation") is None:
-                dep_model["interpretation"] = self.interpret_model(dep_model)
-                self.dbt_project.update_model_directory(dep_model)
+        ref_models = self.__get_ref_models(model)
+        interpretation_hash = self.__get_interpretation_hash(model, ref_models)
+        self.__record_missing_interpretation_hash(model, interpretation_hash)
 
-        interpretation = self.interpret_model(model)
+        if force_reinterpret or not self.__has_current_interpretation(
+            model, interpretation_hash
+        ):
+            interpretation = self.__request_interpretation(model, ref_models)
+        else:
+            logger.info("Using existing interpretation for model: %s", model_name)
+            interpretation = model.get("interpretation")
 
-        model["interpretation"] = interpretation
+        model.update(
+            interpretation=interpretation, interpretation_hash=interpretation_hash
+        )
 
         if write_documentation_to_yaml:
             self.__save_interpretation_to_yaml(model)
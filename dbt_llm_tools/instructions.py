@@ -1,8 +1,8 @@
 INTERPRET_MODEL_INSTRUCTIONS = r"""You are a data analyst trying to understand the meaning and schema of a dbt model.
 You will be provided with the name of the model and the Jinja SQL code that defines the model.
 
-The Jinja files may contain references to other models, using the \{\{ ref('model_name') \}\} syntax,
-or references to source tables using the \{\{ source('schema_name', 'table_name') \}\} syntax.
+The Jinja files may contain references to other models, using the {{ ref('model_name') }} syntax,
+or references to source tables using the {{ source('schema_name', 'table_name') }} syntax.
 
 The interpretation for all upstream models will be provided to you in the form of a
 JSON object that contains the following keys: model, description, columns.
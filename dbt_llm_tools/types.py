@@ -39,6 +39,7 @@ class DbtModelDirectoryEntry(TypedDict):
     sql_contents: str
     documentation: DbtModelDict
     interpretation: DbtModelDict
+    interpretation_hash: str
 
 
 class DbtProjectDirectory(TypedDict):
@@ -1,20 +1,70 @@
+import hashlib
 import os
 import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Union
 
 import chromadb
+from chromadb import Documents, EmbeddingFunction, Embeddings
 from chromadb.utils import embedding_functions
+from openai import OpenAI
 
 from dbt_llm_tools.dbt_model import DbtModel
 from dbt_llm_tools.types import ParsedSearchResult
 
+QUERY_CACHE_SIZE = 128
+QUERY_CACHE_TTL_SECONDS = 300
+UPSERT_BATCH_SIZE = 96
 
-class VectorStore:
+# Every vector store opened on the same path in this process shares a write count, so cached query
+# results are dropped when the collection is changed through any of them. The TTL of the cache
+# covers changes made by other processes.
+_write_counts: dict[str, int] = {}
+_write_counts_lock = threading.Lock()
+
+
+class OpenAIClientEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    An embedding function that sends documents to the OpenAI embeddings API through an existing client.
+    Chroma's OpenAIEmbeddingFunction always builds a client of its own, so it cannot share connections
+    with the client used for chat completions.
+    """
+
+    def __init__(self, client: OpenAI, model_name: str) -> None:
+        """
+        Initializes an embedding function that uses the given OpenAI client.
+
+        Args:
+            client (OpenAI): The OpenAI client used to call the embeddings API.
+            model_name (str): The name of the OpenAI embedding model to be used.
+        """
+        self.__client = client
+        self.__model_name = model_name
+
+    def __call__(self, input: Documents) -> Embeddings:
+        # Newlines are replaced with spaces, matching Chroma's OpenAI embedding function.
+        embeddings = self.__client.embeddings.create(
+            input=[text.replace("\n", " ") for text in input],
+            model=self.__model_name,
+        ).data
+
+        return [
+            embedding.embedding
+            for embedding in sorted(embeddings, key=lambda embedding: embedding.index)
+        ]
+
+
+class VectorStore:  # pylint: disable=too-many-instance-attributes
     """
     A class representing a vector store for dbt models.
 
     Methods:
         get_client: Returns the client object for the vector store.
         upsert_models: Upsert the models into the vector store.
+        query_collection: Query the collection for the nearest neighbours to a query.
+        query_collection_batch: Query the collection for the nearest neighbours to several queries at once.
         reset_collection: Clear the collection of all documents.
     """
 
@@ -24,6 +74,9 @@ class VectorStore:
         embedding_model_name: str = "text-embedding-3-large",
         vector_db_path: str = ".local_storage/chroma.db",
         test_mode: bool = False,
+        hnsw_search_ef: int = None,
+        hnsw_construction_ef: int = None,
+        openai_client: OpenAI = None,
     ) -> None:
         """
         Initializes a vector store for dbt models.
@@ -33,25 +86,42 @@ class VectorStore:
             embedding_model_name (str, optional): The name of the OpenAI embedding model to be used.
             db_persist_path (str, optional): The path to the persistent database file. Defaults to "./chroma.db".
             test_mode (bool, optional): Whether the vector store is being used in test mode. Defaults to False.
+            hnsw_search_ef (int, optional): Size of the candidate list used by the HNSW index at query time.
+                Higher values improve recall at the cost of latency. It is stored with the collection,
+                so it is kept when the store is opened again without it. Defaults to the stored value,
+                or Chroma's default for new collections.
+            hnsw_construction_ef (int, optional): Size of the candidate list used while building the HNSW index.
+                Only applies to newly created or reset collections, because an existing index cannot be rebuilt
+                with it. Defaults to the stored value, or Chroma's default for new collections.
+            openai_client (OpenAI, optional): An existing OpenAI client to send embedding requests through,
+                so its connection pool can be shared. Defaults to a new client created with the API key.
         """
         if not isinstance(vector_db_path, str) or vector_db_path == "":
             raise Exception("Please provide a valid path for the persistent database.")
 
         os.makedirs(vector_db_path, exist_ok=True)
         self.__client = chromadb.PersistentClient(vector_db_path)
+        self.__vector_db_path = os.path.abspath(vector_db_path)
         self.__collection_name = "model_documentation"
 
         self.__openai_api_key = openai_api_key
+        self.__openai_client = openai_client
+        self.__hnsw_params = {
+            "hnsw:search_ef": hnsw_search_ef,
+            "hnsw:construction_ef": hnsw_construction_ef,
+        }
 
         self.__embedding_fn = self.__get_embedding_fn(
             embedding_model_name, test_mode=test_mode
         )
 
         self.__collection = self.__create_collection()
+        self.__query_cache: OrderedDict[tuple, tuple] = OrderedDict()
+        self.__query_cache_lock = threading.Lock()
 
     def __get_embedding_fn(
         self, embedding_model_name: str, test_mode: bool = False
-    ) -> embedding_functions.OpenAIEmbeddingFunction:
+    ) -> EmbeddingFunction:
         """
         Get the embedding function for the vector store.
 
@@ -60,29 +130,61 @@ class VectorStore:
             test_mode (bool, optional): Whether the vector store is being used in test mode. Defaults to False.
 
         Returns:
-            embedding_functions.OpenAIEmbeddingFunction: The embedding function for the vector store.
+            EmbeddingFunction: The embedding function for the vector store.
         """
+        # Stored documents are embedded again when the embedding model changes,
+        # so the name is part of the content hash of every document.
+        self.__embedding_model_name = None if test_mode else embedding_model_name
+
         if test_mode:
             return embedding_functions.DefaultEmbeddingFunction()
 
-        return embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.__openai_api_key, model_name=embedding_model_name
+        if self.__openai_client is None:
+            self.__openai_client = OpenAI(api_key=self.__openai_api_key)
+
+        return OpenAIClientEmbeddingFunction(
+            client=self.__openai_client, model_name=embedding_model_name
         )
 
-    def __create_collection(self, distance_fn: str = "l2") -> chromadb.Collection:
+    def __create_collection(
+        self, distance_fn: str = "l2", previous_metadata: dict = None
+    ) -> chromadb.Collection:
         """
-        Create a new collection in the vector store.
+        Get the collection of the vector store, creating it if it does not exist yet.
+        Chroma replaces the stored metadata of an existing collection with the metadata passed here,
+        so the stored index parameters are kept unless a new value was provided for them.
 
         Args:
             distance_fn (str, optional): The distance function to be used for nearest neighbour search.
-                Defaults to "l2".
+                Only applies to new collections. Defaults to "l2".
+            previous_metadata (dict, optional): The metadata of a collection that was just deleted,
+                whose index parameters a new collection should keep. Defaults to None.
 
         Returns:
-            chromadb.Collection: The newly created collection.
+            chromadb.Collection: The collection of the vector store.
         """
+        try:
+            metadata = dict(
+                self.__client.get_collection(
+                    name=self.__collection_name,
+                    embedding_function=self.__embedding_fn,
+                ).metadata
+                or {}
+            )
+        except ValueError:
+            metadata = dict(previous_metadata or {"hnsw:space": distance_fn})
+
+            if self.__hnsw_params["hnsw:construction_ef"] is not None:
+                metadata["hnsw:construction_ef"] = self.__hnsw_params[
+                    "hnsw:construction_ef"
+                ]
+
+        if self.__hnsw_params["hnsw:search_ef"] is not None:
+            metadata["hnsw:search_ef"] = self.__hnsw_params["hnsw:search_ef"]
+
         return self.__client.get_or_create_collection(
             name=self.__collection_name,
-            metadata={"hnsw:space": distance_fn},
+            metadata=metadata,
             embedding_function=self.__embedding_fn,
         )
 
@@ -95,6 +197,54 @@ class VectorStore:
         """
         self.__embedding_fn = self.__get_embedding_fn(embedding_model_name)
 
+        # The collection embeds documents and queries with the function it was opened with.
+        self.__collection = self.__create_collection()
+
+        with self.__query_cache_lock:
+            self.__query_cache.clear()
+
+    def __get_write_count(self) -> int:
+        """
+        Get the number of writes made to the collection through the vector stores of this process.
+
+        Returns:
+            int: The write count of the vector store path.
+        """
+        return _write_counts.get(self.__vector_db_path, 0)
+
+    def __record_write(self) -> None:
+        """
+        Record a write to the collection, which drops the cached query results of every vector store
+        opened on the same path in this process.
+
+        Returns:
+            None
+        """
+        with _write_counts_lock:
+            _write_counts[self.__vector_db_path] = self.__get_write_count() + 1
+
+        with self.__query_cache_lock:
+            self.__query_cache.clear()
+
+    def __get_stored_content_hashes(self, model_ids: list[str]) -> dict[str, str]:
+        """
+        Get the content hashes of the documents already stored for the given model ids.
+
+        Args:
+            model_ids (list[str]): A list of model ids to look up in the vector store.
+
+        Returns:
+            dict[str, str]: A mapping of model id to the content hash of its stored document.
+        """
+        stored_models = self.__collection.get(ids=model_ids, include=["metadatas"])
+
+        return {
+            model_id: (metadata or {}).get("content_hash")
+            for model_id, metadata in zip(
+                stored_models["ids"], stored_models["metadatas"]
+            )
+        }
+
     def get_client(self) -> chromadb.PersistentClient:
         """
         Returns the client object for the vector store.
@@ -107,16 +257,24 @@ class VectorStore:
     def upsert_models(
         self,
         models: list[DbtModel],
+        batch_size: int = UPSERT_BATCH_SIZE,
     ) -> None:
         """
         Upsert the models into the vector store.
+        Models whose prompt text has not changed since they were last stored are skipped,
+        so they are not sent to the embedding model again.
 
         Args:
             models (list[DbtModel]): A list of dbt model objects to be upserted into the vector store.
+            batch_size (int, optional): The maximum number of models embedded and upserted in a single call.
+            Defaults to 96.
 
         Returns:
             None
         """
+        if batch_size < 1:
+            raise Exception("Please provide a batch size of at least 1.")
+
         documents = []
         metadatas = []
         ids = []
@@ -126,18 +284,61 @@ class VectorStore:
                 raise Exception("Please provide a list of valid dbt model objects.")
 
             model_text = model.as_prompt_text()
+            metadata = {"name": model.name, "tags": json.dumps(model.tags)}
+
+            if model.folder is not None:
+                metadata["folder"] = model.folder
+
+                # Chroma only matches whole metadata values, so every ancestor folder is also stored
+                # under its depth, which lets a filter on a folder match the models in its subfolders.
+                folder_parts = model.folder.split("/")
+
+                for depth in range(1, len(folder_parts) + 1):
+                    metadata[f"folder_{depth}"] = "/".join(folder_parts[:depth])
+
+            # The hash covers the metadata and the embedding model as well as the text, so models
+            # whose folder or tags changed, or that were embedded with another model, are upserted
+            # again even when their documentation did not change.
+            metadata["content_hash"] = hashlib.sha256(
+                json.dumps(
+                    [model_text, metadata, self.__embedding_model_name], sort_keys=True
+                ).encode()
+            ).hexdigest()
 
             documents.append(model_text)
-            metadatas.append(
-                {
-                    "tags": json.dumps(model.tags),
-                }
-            )
+            metadatas.append(metadata)
             ids.append(model.name)
 
-        return self.__collection.upsert(
-            documents=documents, metadatas=metadatas, ids=ids
-        )
+        if len(ids) > 0:
+            stored_hashes = self.__get_stored_content_hashes(ids)
+            changed = [
+                i
+                for i, model_id in enumerate(ids)
+                if stored_hashes.get(model_id) != metadatas[i]["content_hash"]
+            ]
+
+            if len(changed) == 0:
+                return None
+
+            documents = [documents[i] for i in changed]
+            metadatas = [metadatas[i] for i in changed]
+            ids = [ids[i] for i in changed]
+
+        # Each upsert sends all of its documents to the embedding model in one request,
+        # so large projects are split into batches that stay within the API input limits.
+        try:
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+
+                self.__collection.upsert(
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end],
+                )
+        finally:
+            self.__record_write()
+
+        return None
 
     def get_models(self, model_ids: list[str] = None) -> list[DbtModel]:
         """
@@ -162,41 +363,252 @@ class VectorStore:
 
         return models
 
+    def get_folder_filter(self, folders: list[str]) -> dict:
+        """
+        Get a metadata filter that matches the models stored in any of the given folders or their subfolders.
+
+        Args:
+            folders (list[str]): The folders to match, relative to the dbt project root, e.g. ["models/marts"].
+
+        Returns:
+            dict: A Chroma metadata filter that can be passed to query_collection as the where argument.
+        """
+        if len(folders) == 0:
+            raise Exception("Please provide at least one folder to filter on.")
+
+        folder_filters = []
+
+        for folder in folders:
+            folder = folder.strip("/")
+            folder_filters.append({f"folder_{len(folder.split('/'))}": folder})
+
+        if len(folder_filters) == 1:
+            return folder_filters[0]
+
+        return {"$or": folder_filters}
+
+    def __parse_search_results(
+        self, search_results: chromadb.QueryResult
+    ) -> list[list[ParsedSearchResult]]:
+        """
+        Parse the raw results of a collection query.
+
+        Args:
+            search_results (chromadb.QueryResult): The results returned by the collection query.
+
+        Returns:
+            list[list[ParsedSearchResult]]: A list of parsed search results for each query embedding.
+        """
+        return [
+            [
+                {
+                    "id": model_id,
+                    "metadata": metadata,
+                    "document": document,
+                    "distance": distance,
+                }
+                for model_id, metadata, document, distance in zip(
+                    ids, metadatas, documents, distances
+                )
+            ]
+            for ids, metadatas, documents, distances in zip(
+                search_results["ids"],
+                search_results["metadatas"],
+                search_results["documents"],
+                search_results["distances"],
+            )
+        ]
+
+    def __get_query_cache_key(
+        self, query: str, n_results: int, where: Union[dict, None]
+    ) -> tuple:
+        """
+        Get the query cache key for a query, which ignores differences in case and whitespace.
+
+        Args:
+            query (str): The query to be used for nearest neighbour search.
+            n_results (int): The number of nearest neighbours to be returned.
+            where (dict): The Chroma metadata filter of the query, if any.
+
+        Returns:
+            tuple: The query cache key.
+        """
+        return (
+            " ".join(query.casefold().split()),
+            n_results,
+            json.dumps(where, sort_keys=True),
+        )
+
+    def __get_cached_query_result(
+        self, cache_key: tuple
+    ) -> Union[list[ParsedSearchResult], None]:
+        """
+        Get the results of a query from the query cache, removing them if they are out of date.
+
+        Args:
+            cache_key (tuple): The query cache key of the query.
+
+        Returns:
+            list[ParsedSearchResult]: A copy of the cached search results, or None if there are none
+            that were cached since the last write and within the TTL.
+        """
+        with self.__query_cache_lock:
+            cached_result = self.__query_cache.get(cache_key)
+
+            if cached_result is None:
+                return None
+
+            write_count, cached_at, closest_models = cached_result
+
+            if (
+                write_count != self.__get_write_count()
+                or time.monotonic() - cached_at >= QUERY_CACHE_TTL_SECONDS
+            ):
+                del self.__query_cache[cache_key]
+                return None
+
+            self.__query_cache.move_to_end(cache_key)
+
+            return list(closest_models)
+
+    def __cache_query_result(
+        self,
+        cache_key: tuple,
+        write_count: int,
+        closest_models: list[ParsedSearchResult],
+    ) -> None:
+        """
+        Store the results of a query in the query cache, evicting the least recently used entry if it is full.
+
+        Args:
+            cache_key (tuple): The query cache key of the query.
+            write_count (int): The write count of the collection when the query was sent.
+            closest_models (list[ParsedSearchResult]): The parsed search results of the query.
+
+        Returns:
+            None
+        """
+        with self.__query_cache_lock:
+            self.__query_cache[cache_key] = (
+                write_count,
+                time.monotonic(),
+                closest_models,
+            )
+            self.__query_cache.move_to_end(cache_key)
+
+            if len(self.__query_cache) > QUERY_CACHE_SIZE:
+                self.__query_cache.popitem(last=False)
+
     def query_collection(
-        self, query: str, n_results: int = 3
+        self,
+        query: str = None,
+        n_results: int = 3,
+        where: dict = None,
+        query_embedding: list[float] = None,
     ) -> list[ParsedSearchResult]:
         """
         Query the collection for the k nearest neighbours to the query.
+        Results are cached by the normalised query text for up to five minutes,
+        or until the collection is changed through a vector store of this process.
 
         Args:
-            query (str): The query to be used for nearest neighbour search.
+            query (str, optional): The query to be used for nearest neighbour search.
             n_results (int, optional): The number of nearest neighbours to be returned. Defaults to 3.
+            where (dict, optional): A Chroma metadata filter applied by the index during the search,
+                e.g. {"folder": {"$in": ["models/marts"]}}. Defaults to no filter.
+            query_embedding (list[float], optional): An embedding of the query created with the same
+                embedding model as the collection. When provided, it is searched for directly and the
+                query text is not sent to the embedding model. Defaults to None.
 
         Returns:
             list[ParsedSearchResult]: A list of parsed search results.
         """
-        closest_models = []
+        if query_embedding is not None:
+            search_results = self.__collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=["documents", "distances", "metadatas"],
+            )
+
+            return self.__parse_search_results(search_results)[0]
 
         if not isinstance(query, str) or query == "":
             raise Exception("Please provide a valid query.")
 
+        cache_key = self.__get_query_cache_key(query, n_results, where)
+        write_count = self.__get_write_count()
+        cached_result = self.__get_cached_query_result(cache_key)
+
+        if cached_result is not None:
+            return cached_result
+
         search_results = self.__collection.query(
             query_texts=[query],
             n_results=n_results,
+            where=where,
             include=["documents", "distances", "metadatas"],
         )
 
-        for i in range(len(search_results["ids"][0])):
-            closest_models.append(
-                {
-                    "id": search_results["ids"][0][i],
-                    "metadata": search_results["metadatas"][0][i],
-                    "document": search_results["documents"][0][i],
-                    "distance": search_results["distances"][0][i],
-                }
+        closest_models = self.__parse_search_results(search_results)[0]
+        self.__cache_query_result(cache_key, write_count, closest_models)
+
+        return list(closest_models)
+
+    def query_collection_batch(
+        self, queries: list[str], n_results: int = 3, where: dict = None
+    ) -> list[list[ParsedSearchResult]]:
+        """
+        Query the collection for the k nearest neighbours to each of several queries.
+        Queries that are not cached are embedded and searched for together in a single call.
+
+        Args:
+            queries (list[str]): The queries to be used for nearest neighbour search.
+            n_results (int, optional): The number of nearest neighbours to be returned per query. Defaults to 3.
+            where (dict, optional): A Chroma metadata filter applied by the index during the search.
+                Defaults to no filter.
+
+        Returns:
+            list[list[ParsedSearchResult]]: A list of parsed search results for each query, in the same order.
+        """
+        if not isinstance(queries, list) or any(
+            not isinstance(query, str) or query == "" for query in queries
+        ):
+            raise Exception("Please provide a list of valid queries.")
+
+        cache_keys = [
+            self.__get_query_cache_key(query, n_results, where) for query in queries
+        ]
+        write_count = self.__get_write_count()
+        results = {}
+        uncached = {}
+
+        for query, cache_key in zip(queries, cache_keys):
+            if cache_key in results or cache_key in uncached:
+                continue
+
+            cached_result = self.__get_cached_query_result(cache_key)
+
+            if cached_result is None:
+                uncached[cache_key] = query
+            else:
+                results[cache_key] = cached_result
+
+        if uncached:
+            search_results = self.__collection.query(
+                query_texts=list(uncached.values()),
+                n_results=n_results,
+                where=where,
+                include=["documents", "distances", "metadatas"],
             )
 
-        return closest_models
+            for cache_key, closest_models in zip(
+                uncached, self.__parse_search_results(search_results)
+            ):
+                results[cache_key] = closest_models
+                self.__cache_query_result(cache_key, write_count, closest_models)
+
+        return [list(results[cache_key]) for cache_key in cache_keys]
 
     def reset_collection(self) -> None:
         """
@@ -205,5 +617,10 @@ class VectorStore:
         Returns:
             None
         """
+        previous_metadata = self.__collection.metadata
+
         self.__client.delete_collection(self.__collection_name)
-        self.__collection = self.__create_collection()
+        self.__collection = self.__create_collection(
+            previous_metadata=previous_metadata
+        )
+        self.__record_write()
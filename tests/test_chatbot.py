@@ -0,0 +1,190 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from dbt_llm_tools import Chatbot, DbtModel
+from tests.test_data.fake_openai_client import FakeOpenAIClient
+from tests.test_data.model_examples import MODEL_WITH_NAME_AND_DESCRIPTION
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+VALID_PROJECT_PATH = os.path.join(HERE, "test_data/valid_dbt_project")
+
+
+class ChatbotTestCase(unittest.TestCase):
+    """
+    Test cases for the Chatbot class.
+    """
+
+    def setUp(self):
+        storage = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(storage.cleanup)
+
+        self.storage_path = storage.name
+        self.openai_client = FakeOpenAIClient()
+
+    def create_chatbot(self, **kwargs) -> Chatbot:
+        """
+        Create a chatbot that sends its requests to the fake OpenAI client,
+        with a single model loaded into its vector store.
+        """
+        chatbot = Chatbot(
+            VALID_PROJECT_PATH,
+            "api_key",
+            database_path=os.path.join(self.storage_path, "db.json"),
+            vector_db_path=os.path.join(self.storage_path, "chroma.db"),
+            openai_client=self.openai_client,
+            **kwargs,
+        )
+        chatbot.store.upsert_models([DbtModel(MODEL_WITH_NAME_AND_DESCRIPTION)])
+
+        return chatbot
+
+    def test_repeated_question_is_answered_from_cache(self):
+        """
+        Test for the case when the same question is asked twice with the same context.
+        """
+        chatbot = self.create_chatbot()
+
+        first_response = chatbot.ask_question("What does the model contain?")
+        second_response = chatbot.ask_question("What does the model contain?")
+
+        self.assertEqual(len(self.openai_client.chat.completions.calls), 1)
+        self.assertEqual(second_response.content, first_response.content)
+        self.assertEqual(chatbot.cache_stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_question_is_answered_again_after_context_changes(self):
+        """
+        Test for the case when the documentation of the closest model changes between two questions.
+        """
+        chatbot = self.create_chatbot()
+
+        first_response = chatbot.ask_question("What does the model contain?")
+
+        changed_model = dict(MODEL_WITH_NAME_AND_DESCRIPTION)
+        changed_model["description"] = "A changed description"
+        chatbot.store.upsert_models([DbtModel(changed_model)])
+
+        second_response = chatbot.ask_question("What does the model contain?")
+
+        self.assertEqual(len(self.openai_client.chat.completions.calls), 2)
+        self.assertIn(
+            "A changed description",
+            self.openai_client.chat.completions.calls[1][-2]["content"],
+        )
+        self.assertNotEqual(second_response.content, first_response.content)
+        self.assertEqual(chatbot.cache_stats(), {"hits": 0, "misses": 2, "size": 2})
+
+    def test_cached_response_expires(self):
+        """
+        Test for the case when the same question is asked again after the cached response has expired.
+        """
+        chatbot = self.create_chatbot(response_cache_ttl=60)
+
+        with mock.patch("dbt_llm_tools.chatbot.time.monotonic") as monotonic:
+            monotonic.return_value = 1000.0
+            chatbot.ask_question("What does the model contain?")
+
+            monotonic.return_value = 1059.0
+            chatbot.ask_question("What does the model contain?")
+            self.assertEqual(len(self.openai_client.chat.completions.calls), 1)
+
+            monotonic.return_value = 1060.0
+            chatbot.ask_question("What does the model contain?")
+            self.assertEqual(len(self.openai_client.chat.completions.calls), 2)
+
+        self.assertEqual(chatbot.cache_stats(), {"hits": 1, "misses": 2, "size": 1})
+
+    def test_response_cache_disabled(self):
+        """
+        Test for the case when the response cache is disabled.
+        """
+        for response_cache_ttl in [None, 0]:
+            self.openai_client = FakeOpenAIClient()
+            chatbot = self.create_chatbot(response_cache_ttl=response_cache_ttl)
+
+            chatbot.ask_question("What does the model contain?")
+            chatbot.ask_question("What does the model contain?")
+
+            self.assertEqual(len(self.openai_client.chat.completions.calls), 2)
+            self.assertEqual(chatbot.cache_stats(), {"hits": 0, "misses": 0, "size": 0})
+
+    def test_streamed_response_is_cached_once_consumed(self):
+        """
+        Test for the case when a streamed response is consumed to the end and the question is asked again.
+        """
+        chatbot = self.create_chatbot()
+
+        response = chatbot.ask_question("What does the model contain?", stream=True)
+        self.assertEqual(chatbot.cache_stats()["size"], 0)
+
+        streamed_content = "".join(response)
+        self.assertEqual(chatbot.cache_stats()["size"], 1)
+
+        cached_response = chatbot.ask_question("What does the model contain?")
+        cached_stream = chatbot.ask_question(
+            "What does the model contain?", stream=True
+        )
+
+        self.assertEqual(len(self.openai_client.chat.completions.calls), 1)
+        self.assertEqual(cached_response.content, streamed_content)
+        self.assertEqual(list(cached_stream), [streamed_content])
+        self.assertEqual(chatbot.cache_stats(), {"hits": 2, "misses": 1, "size": 1})
+
+    def test_partially_consumed_stream_is_not_cached(self):
+        """
+        Test for the case when a streamed response is abandoned before its end.
+        """
+        chatbot = self.create_chatbot()
+
+        response = chatbot.ask_question("What does the model contain?", stream=True)
+        next(response)
+
+        chatbot.ask_question("What does the model contain?")
+
+        self.assertEqual(len(self.openai_client.chat.completions.calls), 2)
+
+    def test_get_model_names_only(self):
+        """
+        Test for the case when only the names of the closest models are requested.
+        """
+        chatbot = self.create_chatbot()
+
+        model_names = chatbot.ask_question(
+            "What does the model contain?", get_model_names_only=True
+        )
+
+        self.assertEqual(model_names, "model_with_name_and_description")
+        self.assertEqual(len(self.openai_client.chat.completions.calls), 0)
+
+    def test_close_leaves_a_shared_client_open(self):
+        """
+        Test for the case when a chatbot that was given an existing OpenAI client is closed.
+        """
+        chatbot = self.create_chatbot()
+
+        chatbot.close()
+
+        self.assertFalse(self.openai_client.closed)
+
+    def test_close_closes_its_own_client(self):
+        """
+        Test for the case when a chatbot that created its own OpenAI client is closed.
+        """
+        with mock.patch(
+            "dbt_llm_tools.chatbot.OpenAI", return_value=self.openai_client
+        ):
+            chatbot = Chatbot(
+                VALID_PROJECT_PATH,
+                "api_key",
+                database_path=os.path.join(self.storage_path, "db.json"),
+                vector_db_path=os.path.join(self.storage_path, "chroma.db"),
+            )
+
+        chatbot.close()
+
+        self.assertTrue(self.openai_client.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
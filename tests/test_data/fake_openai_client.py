@@ -0,0 +1,90 @@
+import json
+import re
+import string
+import threading
+from types import SimpleNamespace
+
+
+class FakeEmbeddings:
+    """
+    A stand-in for the OpenAI embeddings resource that records every request.
+    Each text is embedded as the counts of the letters it contains.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.models = []
+
+    def create(self, input, model):  # pylint: disable=redefined-builtin
+        self.calls.append(list(input))
+        self.models.append(model)
+
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(
+                    index=index,
+                    embedding=[
+                        float(text.lower().count(letter)) + 1.0
+                        for letter in string.ascii_lowercase
+                    ],
+                )
+                for index, text in enumerate(input)
+            ]
+        )
+
+
+class FakeChatCompletions:
+    """
+    A stand-in for the OpenAI chat completions resource that records every request.
+    Each response is a JSON object with the name of the interpreted model, if there is one,
+    and a description that is numbered by the order in which the requests were made.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.__lock = threading.Lock()
+
+    def create(self, model, messages, stream=False):
+        with self.__lock:
+            self.calls.append(messages)
+            response_number = len(self.calls)
+
+        model_name = re.search(r"is called (\w+)\.", messages[-1]["content"])
+        content = json.dumps(
+            {
+                "name": model_name.group(1) if model_name else None,
+                "description": f"Response {response_number}",
+            }
+        )
+
+        if stream:
+            return iter(
+                [
+                    SimpleNamespace(
+                        choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))]
+                    )
+                    for piece in [content[:10], content[10:], None]
+                ]
+            )
+
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(role="assistant", content=content)
+                )
+            ]
+        )
+
+
+class FakeOpenAIClient:
+    """
+    A stand-in for the OpenAI client that never makes a network request.
+    """
+
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+        self.chat = SimpleNamespace(completions=FakeChatCompletions())
+        self.closed = False
+
+    def close(self):
+        self.closed = True
@@ -1,5 +1,8 @@
+import gc
 import os
+import tempfile
 import unittest
+import warnings
 
 from dbt_llm_tools import DbtProject
 
@@ -100,6 +103,104 @@ class DbtProjectTestCase(unittest.TestCase):
         self.assertEqual(models[0]["name"], "staging_1")
         self.assertEqual(models[1]["name"], "staging_2")
 
+    def test_parse_finds_dependencies_in_topological_order(self):
+        """
+        Test for the case when models share upstream models, which should only be listed once
+        and always before the models that reference them.
+        """
+        with tempfile.TemporaryDirectory() as project_root:
+            write_project(
+                project_root,
+                {
+                    "stg_a": "select 1",
+                    "int_b": "select * from {{ ref('stg_a') }}",
+                    "int_c": "select * from {{ ref('stg_a') }}",
+                    "fct_d": "select * from {{ ref('int_b') }} join {{ ref('int_c') }}",
+                },
+            )
+            project = DbtProject(
+                project_root,
+                database_path=os.path.join(project_root, "directory.json"),
+            )
+
+            directory = project.parse()
+
+        self.assertEqual(directory["models"]["fct_d"]["refs"], ["int_b", "int_c"])
+        self.assertEqual(
+            directory["models"]["fct_d"]["deps"], ["stg_a", "int_b", "int_c"]
+        )
+        self.assertEqual(directory["models"]["stg_a"]["deps"], [])
+
+    def test_parse_with_circular_references(self):
+        """
+        Test for the case when models reference each other in a cycle.
+        """
+        with tempfile.TemporaryDirectory() as project_root:
+            write_project(
+                project_root,
+                {
+                    "model_a": "select * from {{ ref('model_b') }}",
+                    "model_b": "select * from {{ ref('model_a') }}",
+                },
+            )
+            project = DbtProject(
+                project_root,
+                database_path=os.path.join(project_root, "directory.json"),
+            )
+
+            with self.assertRaisesRegex(Exception, "Circular reference found"):
+                project.parse()
+
+    def test_update_model_directory_closes_the_directory_file(self):
+        """
+        Test that updating a model in the directory does not leave the directory file open.
+        """
+        with tempfile.TemporaryDirectory() as project_root:
+            write_project(project_root, {"model_a": "select 1 as id"})
+            project = DbtProject(
+                project_root,
+                database_path=os.path.join(project_root, "directory.json"),
+            )
+            project.parse()
+
+            model = project.get_models(models=["model_a"])[0]
+            model["interpretation"] = {"name": "model_a"}
+
+            with warnings.catch_warnings(record=True) as caught_warnings:
+                warnings.simplefilter("always", ResourceWarning)
+                project.update_model_directory(model)
+                gc.collect()
+
+            updated_model = project.get_models(models=["model_a"])[0]
+
+        self.assertEqual(updated_model["interpretation"], {"name": "model_a"})
+        self.assertEqual(
+            [
+                warning
+                for warning in caught_warnings
+                if issubclass(warning.category, ResourceWarning)
+            ],
+            [],
+        )
+
+
+def write_project(project_root: str, models: dict[str, str]):
+    """
+    Write a minimal dbt project with the given model names and SQL contents.
+    """
+    os.makedirs(os.path.join(project_root, "models"))
+
+    with open(
+        os.path.join(project_root, "dbt_project.yml"), "w", encoding="utf-8"
+    ) as f:
+        f.write("name: test_project\n")
+
+    for name, sql in models.items():
+        with open(
+            os.path.join(project_root, "models", f"{name}.sql"), "w", encoding="utf-8"
+        ) as f:
+            f.write(sql)
+
 
 if __name__ == "__main__":
     unittest.main()
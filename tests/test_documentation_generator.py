@@ -1,7 +1,13 @@
+import json
 import os
+import tempfile
+import threading
 import unittest
+from unittest import mock
 
 from dbt_llm_tools import DocumentationGenerator
+from tests.test_data.fake_openai_client import FakeOpenAIClient
+from tests.test_dbt_project import write_project
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 VALID_PROJECT_PATH = os.path.join(HERE, "test_data/valid_dbt_project")
@@ -33,3 +39,178 @@ class DocumentationGeneratorTestCase(unittest.TestCase):
         """
         with self.assertRaises(Exception):
             DocumentationGenerator(VALID_PROJECT_PATH, None)
+
+    def test_interpret_model_without_sql_contents(self):
+        """
+        Test for the case when a model without any SQL code is interpreted.
+        """
+        openai_client = FakeOpenAIClient()
+        generator = DocumentationGenerator(
+            VALID_PROJECT_PATH, "api_key", openai_client=openai_client
+        )
+
+        with self.assertRaisesRegex(Exception, "No SQL code found for model model_1"):
+            generator.interpret_model({"name": "model_1", "refs": []})
+
+        self.assertEqual(len(openai_client.chat.completions.calls), 0)
+
+    def test_generate_documentation_interprets_upstream_models_level_by_level(self):
+        """
+        Test that every upstream model is interpreted once, after the models it references,
+        and that the directory is only used from the calling thread.
+        """
+        openai_client = FakeOpenAIClient()
+        directory_threads = set()
+
+        with tempfile.TemporaryDirectory() as project_root:
+            write_project(project_root, DIAMOND_PROJECT_MODELS)
+            generator = DocumentationGenerator(
+                project_root,
+                "api_key",
+                database_path=os.path.join(project_root, "directory.json"),
+                openai_client=openai_client,
+            )
+            generator.dbt_project.parse()
+
+            for method_name in ["get_models", "update_model_directory"]:
+                method = getattr(generator.dbt_project, method_name)
+                patcher = mock.patch.object(
+                    generator.dbt_project,
+                    method_name,
+                    side_effect=record_thread(method, directory_threads),
+                )
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+            interpretation = generator.generate_documentation("fct_d")
+
+        prompts = {
+            get_interpreted_model_name(messages): "\n".join(
+                message["content"] for message in messages
+            )
+            for messages in openai_client.chat.completions.calls
+        }
+
+        self.assertEqual(len(openai_client.chat.completions.calls), 4)
+        self.assertEqual(set(prompts), {"stg_a", "int_b", "int_c", "fct_d"})
+        self.assertEqual(interpretation["name"], "fct_d")
+        self.assertEqual(directory_threads, {threading.main_thread()})
+
+        for model_name, refs in DIAMOND_PROJECT_REFS.items():
+            for ref in refs:
+                self.assertIn(f"## {ref}\n", prompts[model_name])
+
+    def test_generate_documentation_reinterprets_models_whose_sql_changed(self):
+        """
+        Test that stored interpretations are reused until the SQL code of a model changes,
+        and that the models downstream of the changed model are interpreted again too.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as project_root:
+            write_project(project_root, DIAMOND_PROJECT_MODELS)
+            generator = DocumentationGenerator(
+                project_root,
+                "api_key",
+                database_path=os.path.join(project_root, "directory.json"),
+                openai_client=openai_client,
+            )
+            generator.dbt_project.parse()
+
+            first_interpretation = generator.generate_documentation("fct_d")
+            self.assertEqual(len(openai_client.chat.completions.calls), 4)
+
+            generator.dbt_project.parse()
+            second_interpretation = generator.generate_documentation("fct_d")
+            self.assertEqual(len(openai_client.chat.completions.calls), 4)
+            self.assertEqual(second_interpretation, first_interpretation)
+
+            with open(
+                os.path.join(project_root, "models", "int_b.sql"), "w", encoding="utf-8"
+            ) as f:
+                f.write("select id, 1 as b from {{ ref('stg_a') }}")
+
+            generator.dbt_project.parse()
+            third_interpretation = generator.generate_documentation("fct_d")
+
+        reinterpreted_models = [
+            get_interpreted_model_name(messages)
+            for messages in openai_client.chat.completions.calls[4:]
+        ]
+
+        self.assertEqual(reinterpreted_models, ["int_b", "fct_d"])
+        self.assertNotEqual(third_interpretation, first_interpretation)
+
+    def test_generate_documentation_reuses_interpretations_stored_without_hashes(self):
+        """
+        Test that interpretations stored before their hashes were recorded are reused,
+        and that their hashes are recorded instead.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as project_root:
+            database_path = os.path.join(project_root, "directory.json")
+            write_project(project_root, DIAMOND_PROJECT_MODELS)
+            generator = DocumentationGenerator(
+                project_root,
+                "api_key",
+                database_path=database_path,
+                openai_client=openai_client,
+            )
+            generator.dbt_project.parse()
+            generator.generate_documentation("fct_d")
+
+            with open(database_path, encoding="utf-8") as f:
+                directory = json.load(f)
+
+            for document in directory["_default"].values():
+                document.pop("interpretation_hash", None)
+
+            with open(database_path, "w", encoding="utf-8") as f:
+                json.dump(directory, f)
+
+            generator.generate_documentation("fct_d")
+            models = generator.dbt_project.get_models(
+                models=list(DIAMOND_PROJECT_MODELS)
+            )
+
+        self.assertEqual(len(openai_client.chat.completions.calls), 4)
+        self.assertTrue(all("interpretation_hash" in model for model in models))
+
+
+DIAMOND_PROJECT_MODELS = {
+    "stg_a": "select 1 as id",
+    "int_b": "select * from {{ ref('stg_a') }}",
+    "int_c": "select * from {{ ref('stg_a') }}",
+    "fct_d": "select * from {{ ref('int_b') }} join {{ ref('int_c') }} using (id)",
+}
+
+DIAMOND_PROJECT_REFS = {
+    "stg_a": [],
+    "int_b": ["stg_a"],
+    "int_c": ["stg_a"],
+    "fct_d": ["int_b", "int_c"],
+}
+
+
+def record_thread(method, threads: set):
+    """
+    Wrap a method so that the thread it is called from is added to the given set.
+    """
+
+    def wrapper(*args, **kwargs):
+        threads.add(threading.current_thread())
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+def get_interpreted_model_name(messages: list[dict]) -> str:
+    """
+    Get the name of the model that a recorded prompt asks to interpret.
+    """
+    return messages[-1]["content"].split("is called ", 1)[1].split(".", 1)[0]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
+import tempfile
 import unittest
+from unittest import mock
 
 from dbt_llm_tools import DbtModel, VectorStore
+from tests.test_data.fake_openai_client import FakeOpenAIClient
 from tests.test_data.model_examples import (
     INVALID_MODEL,
     MODEL_WITH_NAME_AND_DESCRIPTION,
@@ -88,6 +91,17 @@ class VectorStoreTestCase(unittest.TestCase):
         with self.assertRaises(Exception):
             vector_store.query_collection("")
 
+    def test_vector_store_batch_queried_with_invalid_query(self):
+        """
+        Test for the case when the vector store is batch queried with an empty query string.
+        """
+        vector_store = VectorStore(
+            "api_key", test_mode=True, vector_db_path=".local_storage/test_chroma.db"
+        )
+
+        with self.assertRaises(Exception):
+            vector_store.query_collection_batch(["valid query", ""])
+
     def test_vector_store_collection_reset(self):
         """
         Test for the case when the vector store collection is reset.
@@ -107,3 +121,270 @@ class VectorStoreTestCase(unittest.TestCase):
 
         vector_store.reset_collection()
         self.assertEqual(len(vector_store.get_models()), 0)
+
+    def test_vector_store_upserted_with_invalid_batch_size(self):
+        """
+        Test for the case when models are upserted with a batch size below 1,
+        including when none of the models have changed.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+            vector_store.upsert_models([DbtModel(MODEL_WITH_ONLY_NAME)])
+
+            with self.assertRaisesRegex(Exception, "batch size of at least 1"):
+                vector_store.upsert_models([], batch_size=0)
+
+            with self.assertRaisesRegex(Exception, "batch size of at least 1"):
+                vector_store.upsert_models(
+                    [DbtModel(MODEL_WITH_ONLY_NAME)], batch_size=0
+                )
+
+        self.assertEqual(len(openai_client.embeddings.calls), 1)
+
+    def test_models_are_embedded_again_after_embedding_model_changes(self):
+        """
+        Test for the case when unchanged models are upserted again with another embedding model,
+        either set on the open store or used to open the store again.
+        """
+        openai_client = FakeOpenAIClient()
+        models = [DbtModel(MODEL_WITH_ONLY_NAME)]
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key",
+                embedding_model_name="model-a",
+                vector_db_path=vector_db_path,
+                openai_client=openai_client,
+            )
+            vector_store.upsert_models(models)
+            self.assertEqual(len(openai_client.embeddings.calls), 1)
+
+            vector_store.set_embedding_fn("model-b")
+            vector_store.upsert_models(models)
+            self.assertEqual(len(openai_client.embeddings.calls), 2)
+
+            vector_store = VectorStore(
+                "api_key",
+                embedding_model_name="model-c",
+                vector_db_path=vector_db_path,
+                openai_client=openai_client,
+            )
+            vector_store.upsert_models(models)
+            self.assertEqual(len(openai_client.embeddings.calls), 3)
+
+            vector_store.upsert_models(models)
+            vector_store.query_collection("hello")
+
+        self.assertEqual(
+            openai_client.embeddings.models,
+            ["model-a", "model-b", "model-c", "model-c"],
+        )
+
+    def test_unchanged_models_are_not_embedded_again(self):
+        """
+        Test for the case when the same models are upserted twice and then one of them changes.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+
+            vector_store.upsert_models(
+                [
+                    DbtModel(MODEL_WITH_ONLY_NAME),
+                    DbtModel(MODEL_WITH_NAME_AND_DESCRIPTION),
+                ]
+            )
+            self.assertEqual(len(openai_client.embeddings.calls), 1)
+            self.assertEqual(len(openai_client.embeddings.calls[0]), 2)
+
+            vector_store.upsert_models(
+                [
+                    DbtModel(MODEL_WITH_ONLY_NAME),
+                    DbtModel(MODEL_WITH_NAME_AND_DESCRIPTION),
+                ]
+            )
+            self.assertEqual(len(openai_client.embeddings.calls), 1)
+
+            changed_model = dict(MODEL_WITH_NAME_AND_DESCRIPTION)
+            changed_model["description"] = "A changed description"
+
+            vector_store.upsert_models(
+                [DbtModel(MODEL_WITH_ONLY_NAME), DbtModel(changed_model)]
+            )
+            self.assertEqual(len(openai_client.embeddings.calls), 2)
+            self.assertEqual(
+                openai_client.embeddings.calls[1],
+                [DbtModel(changed_model).as_prompt_text()],
+            )
+
+    def test_vector_store_queried_with_folder_filter(self):
+        """
+        Test for the case when the vector store is queried for the models in a folder and its subfolders.
+        """
+        models = [
+            DbtModel({"name": "fct_orders"}, folder="models/marts"),
+            DbtModel({"name": "fct_revenue"}, folder="models/marts/finance"),
+            DbtModel({"name": "fct_legacy_orders"}, folder="models/marts_legacy"),
+            DbtModel({"name": "stg_orders"}, folder="models/staging"),
+            DbtModel({"name": "orders_without_folder"}),
+        ]
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key",
+                vector_db_path=vector_db_path,
+                openai_client=FakeOpenAIClient(),
+            )
+            vector_store.upsert_models(models)
+
+            marts_results = vector_store.query_collection(
+                "orders",
+                n_results=5,
+                where=vector_store.get_folder_filter(["models/marts/"]),
+            )
+            finance_and_staging_results = vector_store.query_collection(
+                "orders",
+                n_results=5,
+                where=vector_store.get_folder_filter(
+                    ["models/marts/finance", "models/staging"]
+                ),
+            )
+
+            with self.assertRaises(Exception):
+                vector_store.get_folder_filter([])
+
+        self.assertEqual(
+            sorted(result["id"] for result in marts_results),
+            ["fct_orders", "fct_revenue"],
+        )
+        self.assertEqual(
+            sorted(result["id"] for result in finance_and_staging_results),
+            ["fct_revenue", "stg_orders"],
+        )
+
+    def test_query_results_are_cached_until_the_collection_changes(self):
+        """
+        Test for the case when the same query is repeated with different case and whitespace,
+        before and after the collection changes.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+            vector_store.upsert_models([DbtModel(MODEL_WITH_ONLY_NAME)])
+            calls = len(openai_client.embeddings.calls)
+
+            results = vector_store.query_collection("hello")
+            self.assertEqual(len(openai_client.embeddings.calls), calls + 1)
+
+            self.assertEqual(vector_store.query_collection("  HELLO "), results)
+            self.assertEqual(len(openai_client.embeddings.calls), calls + 1)
+
+            vector_store.upsert_models([DbtModel(MODEL_WITH_NAME_AND_DESCRIPTION)])
+            calls = len(openai_client.embeddings.calls)
+
+            self.assertEqual(len(vector_store.query_collection("hello")), 2)
+            self.assertEqual(len(openai_client.embeddings.calls), calls + 1)
+
+            vector_store.reset_collection()
+
+            self.assertEqual(vector_store.query_collection("hello"), [])
+            self.assertEqual(len(openai_client.embeddings.calls), calls + 2)
+
+    def test_query_results_are_not_reused_after_another_store_changes_the_collection(
+        self,
+    ):
+        """
+        Test for the case when the collection is changed through another vector store opened on the same path.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+            other_vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+            vector_store.upsert_models([DbtModel(MODEL_WITH_ONLY_NAME)])
+
+            self.assertEqual(len(vector_store.query_collection("hello")), 1)
+
+            other_vector_store.upsert_models(
+                [DbtModel(MODEL_WITH_NAME_AND_DESCRIPTION)]
+            )
+
+            self.assertEqual(len(vector_store.query_collection("hello")), 2)
+            self.assertEqual(
+                len(vector_store.query_collection_batch(["hello", "HELLO"])[1]), 2
+            )
+
+    def test_query_results_expire(self):
+        """
+        Test for the case when the same query is repeated after its cached results have expired.
+        """
+        openai_client = FakeOpenAIClient()
+
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            vector_store = VectorStore(
+                "api_key", vector_db_path=vector_db_path, openai_client=openai_client
+            )
+            vector_store.upsert_models([DbtModel(MODEL_WITH_ONLY_NAME)])
+            calls = len(openai_client.embeddings.calls)
+
+            with mock.patch("dbt_llm_tools.vector_store.QUERY_CACHE_TTL_SECONDS", 0):
+                vector_store.query_collection("hello")
+                vector_store.query_collection("hello")
+
+            self.assertEqual(len(openai_client.embeddings.calls), calls + 2)
+
+    def test_hnsw_parameters_are_kept_when_the_store_is_reopened(self):
+        """
+        Test for the case when a vector store created with HNSW parameters is opened again without them.
+        """
+        with tempfile.TemporaryDirectory() as vector_db_path:
+            VectorStore(
+                "api_key",
+                vector_db_path=vector_db_path,
+                openai_client=FakeOpenAIClient(),
+                hnsw_search_ef=50,
+                hnsw_construction_ef=200,
+            )
+
+            vector_store = VectorStore(
+                "api_key",
+                vector_db_path=vector_db_path,
+                openai_client=FakeOpenAIClient(),
+                hnsw_construction_ef=100,
+            )
+            collection = vector_store.get_client().get_collection("model_documentation")
+
+            self.assertEqual(
+                collection.metadata,
+                {
+                    "hnsw:space": "l2",
+                    "hnsw:search_ef": 50,
+                    "hnsw:construction_ef": 200,
+                },
+            )
+
+            vector_store.reset_collection()
+            collection = vector_store.get_client().get_collection("model_documentation")
+
+            self.assertEqual(
+                collection.metadata,
+                {
+                    "hnsw:space": "l2",
+                    "hnsw:search_ef": 50,
+                    "hnsw:construction_ef": 100,
+                },
+            )